@@ -1,18 +1,94 @@
+import io
 import os
+import asyncio
 import uuid
 import shutil
+import hashlib
+import subprocess
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import aiofiles
+import numpy as np
 from PIL import Image, ImageSequence
 from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba 是可选依赖, 缺失时通道交换退回 NumPy 实现
+    njit = None
+
 
 # --- 新增的辅助函数 ---
+def _skip_sub_blocks(fp):
+    """跳过GIF中以长度字节开头、以0结尾的数据子块序列。"""
+    while True:
+        size = fp.read(1)
+        if not size or size[0] == 0:
+            return
+        fp.seek(size[0], os.SEEK_CUR)
+
+
+def _scan_gif_frame_durations(fp) -> list:
+    """
+    只遍历GIF的块头读取每帧时长, 不解码任何像素数据。
+    每帧的时长取自其前面的图形控制扩展块, 缺失时为100毫秒。
+    """
+    fp.seek(0)
+    header = fp.read(13)
+    if len(header) < 13 or header[:3] != b"GIF":
+        raise ValueError("不是有效的GIF文件")
+    flags = header[10]
+    if flags & 0x80:
+        fp.seek(3 << ((flags & 7) + 1), os.SEEK_CUR)
+
+    frame_durations_ms = []
+    duration = None
+    while True:
+        marker = fp.read(1)
+        if not marker or marker == b";":
+            break
+        if marker == b"!":
+            label = fp.read(1)
+            if label == b"\xf9":
+                block = fp.read(fp.read(1)[0])
+                if len(block) >= 3:
+                    duration = int.from_bytes(block[1:3], "little") * 10
+            _skip_sub_blocks(fp)
+        elif marker == b",":
+            descriptor = fp.read(9)
+            if len(descriptor) < 9:
+                break
+            flags = descriptor[8]
+            if flags & 0x80:
+                fp.seek(3 << ((flags & 7) + 1), os.SEEK_CUR)
+            fp.seek(1, os.SEEK_CUR)  # LZW 最小码长
+            _skip_sub_blocks(fp)
+            frame_durations_ms.append(100 if duration is None else duration)
+            duration = None
+    return frame_durations_ms
+
+
 def get_gif_duration(image: Image.Image) -> tuple:
     """通过累加所有帧的持续时间来计算GIF的总时长（秒），并返回每帧的时长列表。"""
     frame_durations_ms = []
-    for frame in ImageSequence.Iterator(image):
-        frame_durations_ms.append(frame.info.get('duration', 100))
+    fp = getattr(image, "fp", None)
+    if image.format == "GIF" and fp is not None:
+        # 只扫描块头, 避免为了读取时长而逐帧解码像素
+        position = fp.tell()
+        try:
+            frame_durations_ms = _scan_gif_frame_durations(fp)
+        except (ValueError, IndexError, OSError):
+            frame_durations_ms = []
+        finally:
+            fp.seek(position)
+
+    if not frame_durations_ms:
+        for frame in ImageSequence.Iterator(image):
+            frame_durations_ms.append(frame.info.get('duration', 100))
     
     # 对于单帧图像，Pillow有时不会正确报告时长, 我们给一个默认值
     if not frame_durations_ms:
@@ -34,10 +110,69 @@ def create_default_filename(prefix: str, duration_s: float, suffix: str = "") ->
     return f"{prefix}_{duration_str}s.gif"
 
 
+def _cache_get(cache: OrderedDict, key):
+    """从LRU缓存中取值, 命中时把该项移到最近使用的位置。"""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+def _cache_put(cache: OrderedDict, key, value, maxsize: int):
+    """写入LRU缓存, 超出容量时淘汰最久未使用的项。"""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > maxsize:
+        cache.popitem(last=False)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _swap_channels_jit(frames, gather_index):
+        """按 gather_index 重排 (N, H, W, 4) 帧数组的通道, 各帧并行处理。"""
+        n, h, w, c = frames.shape
+        swapped = np.empty_like(frames)
+        for t in prange(n):
+            for y in range(h):
+                for x in range(w):
+                    for k in range(c):
+                        swapped[t, y, x, k] = frames[t, y, x, gather_index[k]]
+        return swapped
+
+    # 导入时预热, 避免第一个请求承担JIT编译的开销
+    _swap_channels_jit(np.zeros((1, 1, 1, 4), dtype=np.uint8), np.arange(4, dtype=np.intp))
+
+def _swap_channels(frames: np.ndarray, gather_index: np.ndarray) -> np.ndarray:
+    """重排 (N, H, W, 4) 帧数组的通道, 有 numba 时使用JIT内核。"""
+    if njit is not None:
+        return _swap_channels_jit(frames, gather_index)
+    return np.take(frames, gather_index, axis=3)
+
+
 # --- 配置 ---
 OUTPUT_DIR = "processed_gifs"
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+BATCH_RESIZE_MIN_FRAMES = 8  # 帧数少于此值时逐帧缩放, 拼图的开销不划算
+RESIZE_GROUP_SIZE = 16       # 垂直缩放时每组水平拼接的帧数, 各组在线程池中并行
+RESULT_CACHE_SIZE = 32
+VALID_RGB_MAPS = frozenset({"rgb", "rbg", "grb", "gbr", "brg", "bgr"})
+# 每种映射对应的通道 gather 索引, alpha 通道保持原位
+CHANNEL_MAP_INDICES = {
+    rgb_map: np.array([*("rgb".index(c) for c in rgb_map), 3], dtype=np.intp)
+    for rgb_map in VALID_RGB_MAPS
+}
+GIFSICLE = shutil.which("gifsicle")  # 可选, 存在时用它无损地进一步压缩输出
+GIFSICLE_TIMEOUT = 30  # 秒, 超时则放弃优化
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# 以内容哈希为键的处理结果缓存, 相同的上传或翻转直接复用之前的输出
+upload_cache = OrderedDict()  # (内容哈希, 原文件名) -> [(GIF字节, 结果信息), ...]
+flip_cache = OrderedDict()    # 内容哈希 -> 翻转后的GIF字节
+original_gifs = OrderedDict() # 输出文件路径 -> 交换通道前的原图字节
+file_locks = weakref.WeakValueDictionary()  # 输出文件路径 -> asyncio.Lock, 无人持有或等待时自动移除
+
+# Pillow 的 resize 和翻转用到的 NumPy 拷贝在C代码中会释放GIL, 逐帧操作可以并行
+frame_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
 app = FastAPI()
 
 # 挂载静态文件目录，用于提供 index.html 和处理好的 GIF
@@ -46,22 +181,132 @@ app.mount("/processed", StaticFiles(directory=OUTPUT_DIR), name="processed")
 
 
 # --- 核心 GIF 处理逻辑 ---
-def verify_frame_count(filepath: str, expected_frames: int):
+def verify_frame_count(data: bytes, expected_frames: int):
     """验证输出GIF的帧数是否与输入一致。"""
     try:
-        img = Image.open(filepath)
-        actual_frames = sum(1 for _ in ImageSequence.Iterator(img))
+        with Image.open(io.BytesIO(data)) as img:
+            actual_frames = getattr(img, 'n_frames', 1)
         if actual_frames != expected_frames:
             print(f"警告: 预期 {expected_frames} 帧，实际 {actual_frames} 帧")
         return actual_frames
     except Exception as e:
-        print(f"警告: 无法验证文件 {filepath} 的帧数: {e}")
+        print(f"警告: 无法验证输出GIF的帧数: {e}")
         return 0
 
+def _encode_gif(frames: list, save_params: dict) -> bytes:
+    """把帧编码为GIF字节。编码在内存中完成, 写盘交给调用方异步进行。"""
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="GIF", **save_params)
+    data = buffer.getvalue()
+
+    if GIFSICLE:
+        # 只做无损优化: 翻转和交换通道会反复重新编码, 有损压缩会逐次累积失真
+        try:
+            result = subprocess.run([GIFSICLE, "-O3"], input=data, capture_output=True, check=True,
+                                    timeout=GIFSICLE_TIMEOUT)
+            if result.stdout:
+                data = result.stdout
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            print(f"警告: gifsicle 优化失败, 使用 Pillow 的输出: {e}")
+    return data
+
+def _resize_frames(frames: list, box: tuple, size: tuple = (240, 240)) -> list:
+    """
+    把一组同尺寸帧的 box 区域缩放到 size。
+    LANCZOS 是先水平后垂直的可分离滤波: 所有帧竖直拼成一张长图后只做一次水平缩放,
+    水平系数表只计算一次, 且每一行独立计算, 帧与帧之间不会互相渗色。
+    垂直缩放时再把每组帧水平拼接, 每组只调用一次 resize; 各列独立计算, 同样不会渗色。
+    """
+    left, top, right, bottom = box
+    if (right - left, bottom - top) == size:
+        # 与 Image.resize 一致, 尺寸不变时直接裁剪, 不经过预乘和重采样
+        return [frame.crop(box) for frame in frames]
+
+    if len(frames) < BATCH_RESIZE_MIN_FRAMES:
+        return list(frame_executor.map(lambda frame: frame.crop(box).resize(size, Image.Resampling.LANCZOS), frames))
+
+    target_width, target_height = size
+    frame_height = bottom - top
+    mode = frames[0].mode
+    # 与 Image.resize 一致, 带透明通道时在预乘模式下缩放
+    premultiplied_mode = {"RGBA": "RGBa", "LA": "La"}.get(mode, mode)
+
+    atlas = Image.fromarray(np.vstack([np.asarray(frame)[top:bottom, left:right] for frame in frames]))
+    if premultiplied_mode != mode:
+        atlas = atlas.convert(premultiplied_mode)
+    atlas = atlas.resize((target_width, atlas.height), Image.Resampling.LANCZOS)
+
+    rows = np.asarray(atlas)
+    channels = rows.shape[2]
+
+    def resize_group(start):
+        count = min(RESIZE_GROUP_SIZE, len(frames) - start)
+        group = rows[start * frame_height:(start + count) * frame_height]
+        tiled = np.ascontiguousarray(
+            group.reshape(count, frame_height, target_width, channels).transpose(1, 0, 2, 3)
+        ).reshape(frame_height, count * target_width, channels)
+        tiled = Image.frombuffer(premultiplied_mode, (count * target_width, frame_height), tiled, "raw", premultiplied_mode, 0, 1)
+        tiled = tiled.resize((count * target_width, target_height), Image.Resampling.LANCZOS)
+
+        resized_group = []
+        for j in range(count):
+            frame = tiled.crop((j * target_width, 0, (j + 1) * target_width, target_height))
+            resized_group.append(frame.convert(mode) if premultiplied_mode != mode else frame)
+        return resized_group
+
+    groups = frame_executor.map(resize_group, range(0, len(frames), RESIZE_GROUP_SIZE))
+    return [frame for group in groups for frame in group]
+
+def _gif_save_params(frames: list, frame_durations: list, loop: int, has_transparency: bool) -> dict:
+    """
+    构造保存动画GIF的参数。所有帧都是完整合成后的画面:
+    不透明时使用 disposal=1 (保留上一帧) 并开启 optimize, Pillow 会把与上一帧相同的像素写成透明, 只编码变化的部分;
+    有透明区域时必须用 disposal=2 清除上一帧, 否则透明处会透出旧画面; 此时也关闭 optimize,
+    否则首帧没有透明像素时 Pillow 的调色板优化会丢掉透明色索引, 后续帧随之失去透明。
+    """
+    return {
+        'save_all': True,
+        'append_images': frames[1:],
+        'duration': frame_durations,
+        'loop': loop,
+        'optimize': not has_transparency,
+        'disposal': 2 if has_transparency else 1
+    }
+
+def _quantize_frames(frames: list) -> tuple:
+    """
+    用一个共享调色板量化所有帧: 把帧竖直拼接后只做一次 MEDIANCUT 量化, 再切回单帧。
+    RGBA 帧的透明像素统一映射到调色板末尾新增的透明色。
+    返回 (P 模式帧列表, 透明色索引或 None)。
+    """
+    frame_width, frame_height = frames[0].size
+    stacked = np.vstack([np.asarray(frame) for frame in frames])
+    rgb = stacked[..., :3]
+    transparent = stacked[..., 3] < 128 if stacked.shape[-1] == 4 else None
+    if transparent is not None and transparent.any() and not transparent.all():
+        # 透明像素的RGB不可见, 用一个可见像素的颜色填充, 避免它们占用调色板
+        rgb = rgb.copy()
+        rgb[transparent] = rgb[~transparent][0]
+    quantized = Image.fromarray(rgb).quantize(colors=255, method=Image.Quantize.MEDIANCUT)
+
+    transparency = None
+    if transparent is not None:
+        palette = quantized.getpalette()
+        transparency = len(palette) // 3
+        indices = np.array(quantized)
+        indices[transparent] = transparency
+        quantized = Image.fromarray(indices)
+        quantized.putpalette(palette + [0, 0, 0])
+
+    return [
+        quantized.crop((0, i * frame_height, frame_width, (i + 1) * frame_height))
+        for i in range(len(frames))
+    ], transparency
+
 def process_gif(input_path: str, original_filename: str):
     """
-    处理单个GIF文件: resize, split, and save, with robust transparency handling.
-    返回一个包含处理后文件信息的字典列表。
+    处理单个GIF文件: resize, split, and encode, with robust transparency handling.
+    返回一个包含处理后文件信息的字典列表, 以及待写盘的 (输出路径, GIF字节) 列表。
     """
     try:
         original_image = Image.open(input_path)
@@ -74,50 +319,56 @@ def process_gif(input_path: str, original_filename: str):
     
     # --- 任务1: 准备要处理的帧列表 ---
     images_to_process = []
+    # 按解码后的帧判断透明: 首帧不透明时 original_image.info 中没有 transparency, 但后续帧仍可能有透明像素
     all_frames = [frame.convert("RGBA") for frame in ImageSequence.Iterator(original_image)]
+    if all(frame.getextrema()[3][0] == 255 for frame in all_frames):
+        # 没有透明像素的GIF转成RGB即可, 省去全为255的alpha通道在缩放和保存时的开销
+        all_frames = list(frame_executor.map(lambda frame: frame.convert("RGB"), all_frames))
     
     if width == 2 * height: # 分割
         left_box = (0, 0, width // 2, height)
         right_box = (width // 2, 0, width, height)
         
         images_to_process.append({
-            'frames': [frame.crop(left_box) for frame in all_frames],
+            'frames': all_frames,
+            'box': left_box,
             'default_filename': create_default_filename(filename_prefix, duration_s, 'left')
         })
         images_to_process.append({
-            'frames': [frame.crop(right_box) for frame in all_frames],
+            'frames': all_frames,
+            'box': right_box,
             'default_filename': create_default_filename(filename_prefix, duration_s, 'right')
         })
     else: # 不分割
         images_to_process.append({
             'frames': all_frames,
+            'box': (0, 0, width, height),
             'default_filename': create_default_filename(filename_prefix, duration_s)
         })
 
     # --- 任务2: Resize 和 保存 ---
     final_results = []
+    encoded_outputs = []
     
     loop = original_image.info.get('loop', 0)
-    disposal = original_image.info.get('disposal', 2)
 
     for item in images_to_process:
-        processed_frames = [frame.resize((240, 240), Image.Resampling.LANCZOS) for frame in item['frames']]
+        processed_frames = _resize_frames(item['frames'], item['box'])
+        processed_frames, transparency = _quantize_frames(processed_frames) if processed_frames else ([], None)
 
         server_filename = f"{uuid.uuid4()}.gif"
         output_path = os.path.join(OUTPUT_DIR, server_filename)
         
-        save_params = {
-            'save_all': True,
-            'append_images': processed_frames[1:] if len(processed_frames) > 1 else [],
-            'duration': frame_durations,
-            'loop': loop,
-            'optimize': False,
-            'disposal': disposal
-        }
+        save_params = _gif_save_params(processed_frames, frame_durations, loop, transparency is not None)
+        if transparency is not None:
+            save_params['transparency'] = transparency
 
         if processed_frames:
-            processed_frames[0].save(output_path, **save_params)
-            verify_frame_count(output_path, len(item['frames']))
+            data = _encode_gif(processed_frames, save_params)
+            encoded_outputs.append((output_path, data))
+            # 校验需要重新解析刚编码的GIF, 只在调试时开启
+            if os.environ.get("GIF_VERIFY"):
+                verify_frame_count(data, len(item['frames']))
         
         final_results.append({
             "url": f"/processed/{server_filename}",
@@ -125,7 +376,35 @@ def process_gif(input_path: str, original_filename: str):
             "default_filename": item['default_filename']
         })
 
-    return final_results
+    return final_results, encoded_outputs
+
+def _flip_gif_bytes(source_bytes: bytes) -> bytes:
+    """水平翻转GIF的所有帧, 返回编码后的GIF字节。"""
+    img = Image.open(io.BytesIO(source_bytes))
+    _, frame_durations = get_gif_duration(img)
+    loop = img.info.get('loop', 0)
+
+    frames = [frame.convert('RGBA') for frame in ImageSequence.Iterator(img)]
+    # 列反转视图 + 一次连续拷贝, 每帧只做一次反向内存复制
+    flipped_frames = list(frame_executor.map(
+        lambda frame: Image.fromarray(np.ascontiguousarray(np.asarray(frame)[:, ::-1])), frames))
+
+    # 按实际写出的帧判断透明; 迭代结束后 img.info 只反映最后一帧
+    has_transparency = any(np.asarray(frame)[..., 3].min() < 255 for frame in frames)
+    return _encode_gif(flipped_frames, _gif_save_params(flipped_frames, frame_durations, loop, has_transparency))
+
+def _swap_rgb_gif_bytes(original_bytes: bytes, rgb_map: str) -> bytes:
+    """按 rgb_map 重排GIF所有帧的RGB通道, 返回编码后的GIF字节。"""
+    img = Image.open(io.BytesIO(original_bytes))
+    _, frame_durations = get_gif_duration(img)
+    loop = img.info.get('loop', 0)
+
+    stacked = np.stack([np.asarray(frame.convert("RGBA")) for frame in ImageSequence.Iterator(img)])
+    frames = [Image.fromarray(frame) for frame in _swap_channels(stacked, CHANNEL_MAP_INDICES[rgb_map])]
+
+    # 按实际写出的帧判断透明; 迭代结束后 img.info 只反映最后一帧
+    has_transparency = bool(stacked[..., 3].min() < 255)
+    return _encode_gif(frames, _gif_save_params(frames, frame_durations, loop, has_transparency))
 
 # --- API Endpoints ---
 @app.get("/", response_class=HTMLResponse)
@@ -141,30 +420,105 @@ async def upload_gif(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="仅支持GIF格式的文件。")
 
     temp_path = os.path.join(OUTPUT_DIR, f"temp_{uuid.uuid4()}.gif")
-    with open(temp_path, "wb") as buffer:
-        buffer.write(await file.read())
+    hasher = hashlib.blake2b()
+    # 分块写入磁盘, 峰值内存只占一个块而不是整个文件
+    async with aiofiles.open(temp_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            await buffer.write(chunk)
+
+    cache_key = (hasher.hexdigest(), file.filename)
+    cached = _cache_get(upload_cache, cache_key)
+    if cached is not None:
+        os.remove(temp_path)
+        # 之前的输出文件可能已被翻转或交换通道, 所以总是写出新的副本
+        processed_results = []
+        for data, info in cached:
+            server_filename = f"{uuid.uuid4()}.gif"
+            async with aiofiles.open(os.path.join(OUTPUT_DIR, server_filename), "wb") as f:
+                await f.write(data)
+            processed_results.append({"url": f"/processed/{server_filename}", **info})
+        return JSONResponse(content={"results": processed_results})
 
     try:
-        processed_results = process_gif(temp_path, original_filename=file.filename)
+        # process_gif 是CPU密集的同步函数, 放到线程池中运行以免阻塞事件循环
+        processed_results, encoded_outputs = await run_in_threadpool(
+            process_gif, temp_path, original_filename=file.filename)
     except Exception as e:
         os.remove(temp_path)
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
     
     os.remove(temp_path)
+
+    for output_path, data in encoded_outputs:
+        async with aiofiles.open(output_path, "wb") as f:
+            await f.write(data)
+
+    cached = [
+        (data, {k: v for k, v in result.items() if k != "url"})
+        for result, (_, data) in zip(processed_results, encoded_outputs)
+    ]
+    _cache_put(upload_cache, cache_key, cached, RESULT_CACHE_SIZE)
+
     return JSONResponse(content={"results": processed_results})
 
 
-def _ensure_original_exists(filepath: str) -> str:
+def _file_lock(filepath: str) -> asyncio.Lock:
+    """
+    Returns the lock guarding `filepath`. Every read-modify-write of an output file must hold it,
+    otherwise concurrent requests overwrite each other's results or read a half-written file.
+    """
+    lock = file_locks.get(filepath)
+    if lock is None:
+        lock = file_locks[filepath] = asyncio.Lock()
+    return lock
+
+
+def _original_path(filepath: str) -> str:
+    """Returns the path of the backup file holding the original of `filepath`."""
+    path, filename = os.path.split(filepath)
+    name, ext = os.path.splitext(filename)
+    return os.path.join(path, f"{name}_original{ext}")
+
+
+async def _load_original(filepath: str) -> bytes:
     """
-    Ensures a backup of the file exists. If not, creates one from the current file.
-    Returns the path to the backup file.
+    Returns the original bytes of the file, served from memory when possible.
+    On first use the current file becomes the original and is also backed up to disk,
+    which is the fallback once the in-memory copy has been evicted.
+    The caller must hold `_file_lock(filepath)`.
     """
+    data = _cache_get(original_gifs, filepath)
+    if data is not None:
+        return data
+
+    original_path = _original_path(filepath)
+    if os.path.exists(original_path):
+        async with aiofiles.open(original_path, "rb") as f:
+            data = await f.read()
+    else:
+        async with aiofiles.open(filepath, "rb") as f:
+            data = await f.read()
+        async with aiofiles.open(original_path, "wb") as f:
+            await f.write(data)
+
+    _cache_put(original_gifs, filepath, data, RESULT_CACHE_SIZE)
+    return data
+
+
+def _swap_cache_path(filepath: str, rgb_map: str) -> str:
+    """返回某个通道映射结果的缓存文件路径, 与原图备份放在同一目录。"""
     path, filename = os.path.split(filepath)
     name, ext = os.path.splitext(filename)
-    original_path = os.path.join(path, f"{name}_original{ext}")
-    if not os.path.exists(original_path):
-        shutil.copy(filepath, original_path)
-    return original_path
+    return os.path.join(path, f"{name}_swap_{rgb_map}{ext}")
+
+
+def _swap_cache_is_fresh(cache_path: str, filepath: str) -> bool:
+    """缓存结果不早于原图备份时才可复用; 任一文件缺失都视为未命中。"""
+    try:
+        return os.path.getmtime(cache_path) >= os.path.getmtime(_original_path(filepath))
+    except OSError:
+        return False
 
 
 @app.post("/flip")
@@ -174,31 +528,32 @@ async def flip_gif(filename: str):
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="文件未找到。")
 
-    try:
-        img = Image.open(filepath)
-        _, frame_durations = get_gif_duration(img)
-        loop = img.info.get('loop', 0)
-        disposal = img.info.get('disposal', 2)
+    async with _file_lock(filepath):
+        async with aiofiles.open(filepath, "rb") as f:
+            source_bytes = await f.read()
+        source_digest = hashlib.blake2b(source_bytes).hexdigest()
 
-        frames = [frame.convert('RGBA') for frame in ImageSequence.Iterator(img)]
-        flipped_frames = [frame.transpose(Image.FLIP_LEFT_RIGHT) for frame in frames]
-        
-        save_params = {
-            'save_all': True,
-            'append_images': flipped_frames[1:] if len(flipped_frames) > 1 else [],
-            'duration': frame_durations,
-            'loop': loop,
-            'optimize': False,
-            'disposal': disposal
-        }
-        
-        if flipped_frames:
-            flipped_frames[0].save(filepath, **save_params)
+        flipped_bytes = _cache_get(flip_cache, source_digest)
+        if flipped_bytes is not None:
+            async with aiofiles.open(filepath, "wb") as f:
+                await f.write(flipped_bytes)
+            _cache_put(flip_cache, hashlib.blake2b(flipped_bytes).hexdigest(), source_bytes, RESULT_CACHE_SIZE)
+            return JSONResponse(content={"status": "success", "filename": filename})
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"翻转失败: {e}")
+        try:
+            # 解码、翻转和编码都是CPU密集的同步操作, 放到线程池中运行以免阻塞事件循环
+            flipped_bytes = await run_in_threadpool(_flip_gif_bytes, source_bytes)
+            async with aiofiles.open(filepath, "wb") as f:
+                await f.write(flipped_bytes)
+
+            # 翻转两次即回到原图, 双向记录
+            _cache_put(flip_cache, source_digest, flipped_bytes, RESULT_CACHE_SIZE)
+            _cache_put(flip_cache, hashlib.blake2b(flipped_bytes).hexdigest(), source_bytes, RESULT_CACHE_SIZE)
 
-    return JSONResponse(content={"status": "success", "filename": filename})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"翻转失败: {e}")
+
+        return JSONResponse(content={"status": "success", "filename": filename})
 
 
 @app.post("/swap_rgb")
@@ -211,52 +566,40 @@ async def swap_rgb_gif(filename: str, rgb_map: str):
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="文件未找到。")
     
-    if len(rgb_map) != 3 or not all(c in 'rgb' for c in rgb_map.lower()) or len(set(rgb_map.lower())) != 3:
+    rgb_map = rgb_map.lower()
+    if rgb_map not in VALID_RGB_MAPS:
         raise HTTPException(status_code=400, detail="无效的RGB映射。它必须是'rgb'的排列组合, 例如 'gbr'。")
 
-    original_filepath = _ensure_original_exists(filepath)
+    async with _file_lock(filepath):
+        original_bytes = await _load_original(filepath)
+
+        if rgb_map == 'rgb':
+            async with aiofiles.open(filepath, "wb") as f:
+                await f.write(original_bytes)
+            return JSONResponse(content={"status": "success", "filename": filename})
+
+        # 每个文件最多6种排列, 结果比原图备份新时直接复用
+        cache_path = _swap_cache_path(filepath, rgb_map)
+        if _swap_cache_is_fresh(cache_path, filepath):
+            async with aiofiles.open(cache_path, "rb") as f:
+                cached_bytes = await f.read()
+            async with aiofiles.open(filepath, "wb") as f:
+                await f.write(cached_bytes)
+            return JSONResponse(content={"status": "success", "filename": filename})
+
+        try:
+            # 解码、交换通道和编码都是CPU密集的同步操作, 放到线程池中运行以免阻塞事件循环
+            data = await run_in_threadpool(_swap_rgb_gif_bytes, original_bytes, rgb_map)
+            async with aiofiles.open(filepath, "wb") as f:
+                await f.write(data)
+            async with aiofiles.open(cache_path, "wb") as f:
+                await f.write(data)
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"RGB交换失败: {e}")
 
-    if rgb_map.lower() == 'rgb':
-        shutil.copy(original_filepath, filepath)
         return JSONResponse(content={"status": "success", "filename": filename})
 
-    try:
-        img = Image.open(original_filepath)
-        _, frame_durations = get_gif_duration(img)
-        loop = img.info.get('loop', 0)
-        disposal = img.info.get('disposal', 2)
-        
-        frames = []
-        source_channels = "RGB"
-        channel_map_indices = [source_channels.find(c.upper()) for c in rgb_map]
-
-        for frame in ImageSequence.Iterator(img):
-            frame_rgba = frame.convert("RGBA")
-            r, g, b, a = frame_rgba.split()
-            channels = [r, g, b]
-            
-            swapped_channels = [channels[i] for i in channel_map_indices]
-            
-            swapped_frame = Image.merge("RGBA", (*swapped_channels, a))
-            frames.append(swapped_frame)
-        
-        save_params = {
-            'save_all': True,
-            'append_images': frames[1:] if len(frames) > 1 else [],
-            'duration': frame_durations,
-            'loop': loop,
-            'optimize': False,
-            'disposal': disposal
-        }
-        
-        if frames:
-            frames[0].save(filepath, **save_params)
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"RGB交换失败: {e}")
-
-    return JSONResponse(content={"status": "success", "filename": filename})
-
 
 # --- 运行服务器 ---
 if __name__ == "__main__":